@@ -49,6 +49,58 @@ required_vars <- c(survey_vars, outcome_var, exposure_vars, covariates)
 
 cat("需要提取的变量总数:", length(required_vars), "\n")
 
+# 所需变量的列类型（显式声明，避免readxl逐列猜测类型）
+numeric_vars <- c(survey_vars, exposure_vars, "age", "kcal", "HEI2015_ALL")
+# 其中取值为整数编码的设计变量，读入后存为integer（4字节，double为8字节）
+integer_vars <- c("SEQN", "SDMVPSU", "SDMVSTRA")
+# 两个工作簿中这两列大多存为文本单元格：声明为numeric会让readxl逐个单元格发出
+# "Coercing text to numeric"警告（每次运行约1.1万条），故按text读入后再整列转为数值
+text_numeric_vars <- c("WTSAF6YR", "HEI2015_ALL")
+col_type_map <- setNames(
+  ifelse(required_vars %in% setdiff(numeric_vars, text_numeric_vars), "numeric", "text"),
+  required_vars
+)
+
+# 读取Excel：先只读表头，仅解析所需列（其余列 skip）并指定列类型；
+# 失败时回退为自动推断（仍跳过无关列）。结果按 required_vars 的顺序排列列，
+# 与工作簿中的列顺序无关（只重排列引用，不复制数据）
+read_source_excel <- function(path) {
+  header <- names(read_excel(path, n_max = 0))
+  keep <- header %in% required_vars
+  col_types <- ifelse(keep, col_type_map[header], "skip")
+  data <- tryCatch(
+    read_excel(path, col_types = unname(col_types)),
+    error = function(e) {
+      cat("  显式列类型读取失败，回退为自动类型推断:", conditionMessage(e), "\n")
+      read_excel(path, col_types = ifelse(keep, "guess", "skip"))
+    }
+  )
+  data <- mutate(data, across(any_of(text_numeric_vars), as.numeric))
+  data[intersect(required_vars, names(data))]
+}
+
+# 带缓存的读取：解析结果缓存为 <xlsx>.rds，Excel未更新、变量及顺序一致，
+# 且解析方式（列类型表、文本转数值列、读取函数本身）与缓存时相同时才直接读缓存
+load_cached <- function(path) {
+  cache_path <- paste0(path, ".rds")
+  parse_spec <- list(
+    col_types = col_type_map,
+    text_numeric_vars = text_numeric_vars,
+    reader = deparse(body(read_source_excel))
+  )
+  if (file.exists(cache_path) && file.mtime(cache_path) >= file.mtime(path)) {
+    cached <- readRDS(cache_path)
+    if (identical(names(cached), required_vars) && identical(attr(cached, "parse_spec"), parse_spec)) {
+      cat("  使用缓存:", cache_path, "\n")
+      return(cached)
+    }
+  }
+  data <- read_source_excel(path)
+  attr(data, "parse_spec") <- parse_spec
+  saveRDS(data, cache_path)
+  data
+}
+
 # 检查文件是否存在
 cat("\n检查数据文件...\n")
 if (!file.exists("MHO.xlsx")) {
@@ -59,23 +111,26 @@ if (!file.exists("MUO.xlsx")) {
 }
 cat("✓ Excel文件检查通过\n")
 
-# 读取MHO数据
-cat("\n正在读取 MHO.xlsx...\n")
-tryCatch({
-  data_mho <- read_excel("MHO.xlsx")
-  cat("✓ MHO数据读取成功 - 行数:", nrow(data_mho), "列数:", ncol(data_mho), "\n")
-}, error = function(e) {
-  stop("读取MHO.xlsx失败: ", e$message)
-})
-
-# 读取MUO数据
-cat("\n正在读取 MUO.xlsx...\n")
-tryCatch({
-  data_muo <- read_excel("MUO.xlsx")
-  cat("✓ MUO数据读取成功 - 行数:", nrow(data_muo), "列数:", ncol(data_muo), "\n")
-}, error = function(e) {
-  stop("读取MUO.xlsx失败: ", e$message)
-})
+# 并行读取MHO与MUO数据（两个文件互不依赖；Windows不支持fork，退化为串行）
+cat("\n正在读取 MHO.xlsx 与 MUO.xlsx...\n")
+n_read_cores <- if (.Platform$OS.type == "windows") 1L else 2L
+source_data <- parallel::mclapply(
+  c(MHO = "MHO.xlsx", MUO = "MUO.xlsx"),
+  function(path) tryCatch(load_cached(path), error = function(e) e),
+  mc.cores = n_read_cores
+)
+for (label in names(source_data)) {
+  res <- source_data[[label]]
+  if (inherits(res, "try-error")) res <- attr(res, "condition")
+  if (inherits(res, "error")) {
+    stop("读取", label, ".xlsx失败: ", conditionMessage(res))
+  }
+}
+data_mho <- source_data$MHO
+data_muo <- source_data$MUO
+cat("✓ MHO数据读取成功 - 行数:", nrow(data_mho), "列数:", ncol(data_mho), "\n")
+cat("✓ MUO数据读取成功 - 行数:", nrow(data_muo), "列数:", ncol(data_muo), "\n")
+rm(source_data)
 
 # 检查变量完整性
 cat("\n检查变量完整性...\n")
@@ -102,17 +157,15 @@ if (!mho_check || !muo_check) {
 prepare_data <- function(df, outcome_name, dataset_label) {
   cat("处理", dataset_label, "数据...\n")
   
-  # 提取需要的列
+  # 读取时已只保留所需列
   df_clean <- df %>%
-    select(all_of(required_vars)) %>%
     mutate(
+      across(all_of(integer_vars), as.integer),
       # 创建二分类结局变量
-      outcome_binary = ifelse(outcome == outcome_name, 1, 0),
+      outcome_binary = ifelse(outcome == outcome_name, 1L, 0L),
       # 添加数据集标识
       dataset = dataset_label
-    ) %>%
-    # 转换字符变量为因子
-    mutate(across(where(is.character), as.factor))
+    )
   
   cat("  - 提取行数:", nrow(df_clean), "\n")
   cat("  - 结局分布:\n")
@@ -130,7 +183,12 @@ data_muo_clean <- prepare_data(data_muo, "MUO", "MUO")
 
 # 合并数据
 cat("\n合并数据集...\n")
-combined_data <- bind_rows(data_mho_clean, data_muo_clean)
+# 两个数据集结构一致：直接按列拼接字符向量，合并后再统一转换为因子，
+# 避免分别建因子后在合并时再对齐两套水平
+stopifnot(identical(names(data_mho_clean), names(data_muo_clean)))
+combined_data <- bind_rows(data_mho_clean, data_muo_clean) %>%
+  mutate(across(where(is.character), as.factor))
+rm(data_mho, data_muo, data_mho_clean, data_muo_clean)
 
 # ---------------- 黄酮变量变换 ----------------
 if (TRANSFORM_CREATE_LOG || TRANSFORM_CREATE_Z) {
@@ -176,16 +234,17 @@ cat("合并后数据概况:\n")
 cat("  - 总行数:", nrow(combined_data), "\n")
 cat("  - 总列数:", ncol(combined_data), "\n")
 cat("  - 数据集分布:\n")
-print(table(combined_data$dataset, useNA = "ifany"))
+# 数据集分布只统计一次，末尾汇总时复用
+dataset_counts <- table(combined_data$dataset, useNA = "ifany")
+print(dataset_counts)
 cat("  - 总体结局分布:\n")
 print(table(combined_data$outcome, useNA = "ifany"))
 
 # 数据质量检查
 cat("\n数据质量检查...\n")
 
-# 检查缺失值
-missing_summary <- combined_data %>%
-  summarise(across(everything(), ~sum(is.na(.))))
+# 检查缺失值（is.na 对整个数据框一次向量化计算各列缺失数）
+missing_summary <- colSums(is.na(combined_data))
 
 missing_vars <- names(missing_summary)[missing_summary > 0]
 if (length(missing_vars) > 0) {
@@ -210,13 +269,15 @@ for (var in exposure_vars) {
 dir.create("outputs", showWarnings = FALSE)
 cat("\n保存数据到 outputs/clean_data.csv...\n")
 write.csv(combined_data, file.path("outputs","clean_data.csv"), row.names = FALSE)
+# 同时保存二进制副本（保留因子与数值类型），后续脚本优先读取，省去CSV解析
+saveRDS(as.data.frame(combined_data), file.path("outputs","clean_data.rds"))
 
 cat("\n==========================================\n")
 cat("数据整理完成！\n")
 cat("==========================================\n")
-cat("输出文件: outputs/clean_data.csv\n")
+cat("输出文件: outputs/clean_data.csv (及 outputs/clean_data.rds)\n")
 cat("最终数据维度:", nrow(combined_data), "行 ×", ncol(combined_data), "列\n")
 cat("包含数据集:\n")
-cat("  - MHO数据:", sum(combined_data$dataset == "MHO"), "行\n")
-cat("  - MUO数据:", sum(combined_data$dataset == "MUO"), "行\n")
+cat("  - MHO数据:", dataset_counts[["MHO"]], "行\n")
+cat("  - MUO数据:", dataset_counts[["MUO"]], "行\n")
 cat("准备进行RCS分析...\n")
\ No newline at end of file
@@ -22,13 +22,31 @@ options(survey.lonely.psu = "adjust")
 # 检查输入文件
 cat("检查输入文件...\n")
 data_path <- file.path("outputs", "clean_data.csv")
-if (!file.exists(data_path)) {
+rds_path <- file.path("outputs", "clean_data.rds")
+if (!file.exists(data_path) && !file.exists(rds_path)) {
   stop("错误: 未找到 outputs/clean_data.csv 文件，请先运行 01_data_preparation.r")
 }
 
-# 读取数据，并确保分类变量是因子
+# CSV各列类型（按列名声明，跳过read.csv的逐列类型推断；未列出的列如 *_log 仍自动推断）
+clean_data_col_classes <- c(
+  SEQN = "integer", SDMVPSU = "integer", SDMVSTRA = "integer", WTSAF6YR = "numeric",
+  outcome = "factor", outcome_binary = "integer", dataset = "factor",
+  mean_fl_total = "numeric", mean_antho = "numeric", mean_nones = "numeric", mean_3_ols = "numeric",
+  mean_ones = "numeric", mean_iso = "numeric", mean_ols = "numeric",
+  age = "numeric", gender = "factor", race = "factor", income_rate = "factor", edu_level = "factor",
+  smoke = "factor", drink = "factor", cvd = "factor", PA_GROUP = "factor",
+  kcal = "numeric", HEI2015_ALL = "numeric"
+)
+
+# 读取数据，并确保分类变量是因子；优先读取不旧于CSV的RDS副本
 cat("读取合并数据...\n")
-data <- read.csv(data_path, stringsAsFactors = TRUE)
+if (file.exists(rds_path) && (!file.exists(data_path) || file.mtime(rds_path) >= file.mtime(data_path))) {
+  data <- readRDS(rds_path)
+} else {
+  data <- read.csv(data_path, stringsAsFactors = TRUE, colClasses = clean_data_col_classes)
+  # 写入RDS副本，之后重复运行直接读取二进制文件
+  saveRDS(data, rds_path)
+}
 cat("✓ 数据读取成功 - 行数:", nrow(data), "列数:", ncol(data), "\n")
 
 
@@ -63,133 +81,264 @@ cat("  - 协变量:", length(covariates), "个\n")
 
 dir.create("outputs", showWarnings = FALSE)
 
-# 初始化结果存储
-all_results <- list()
-all_predictions <- list()
+# 样条工具函数：节点只在拟合数据上计算一次，预测时复用同一组节点
+# 节点(5/35/65/95%)、预测范围(0-95%)与参照点(中位数)来自同一样本，一次 quantile() 排序得到
+exposure_quantiles <- function(x) {
+  q <- quantile(x, c(0, 0.05, 0.35, 0.5, 0.65, 0.95), na.rm = TRUE, names = FALSE)
+  list(knots = q[c(2, 3, 5, 6)], pred_range = q[c(1, 6)], ref_value = q[4])
+}
 
-# RCS分析主循环
-cat("\n开始RCS分析...\n")
+build_spline_basis <- function(x, knots, prefix) {
+  basis <- rcspline.eval(x, knots = knots, inclx = TRUE)
+  colnames(basis) <- paste0(prefix, "_rcs", seq_len(ncol(basis)))
+  basis
+}
+
+# 协变量哑变量编码：每个结局只编码一次，7个暴露变量的模型共用
+# (保留缺失行，使结果与原数据逐行对齐；缺失值在svyglm中照常剔除)
+# 列名统一为合法的 cov_1..cov_k（原始列名如 income_rate<=1.3 含非法及非ASCII字符，拼入公式不可靠），
+# "factor_groups" 属性记录每个因子对应的哑变量列
+encode_covariates <- function(df, covariates) {
+  cov_terms <- terms(as.formula(paste("~", paste(covariates, collapse = " + "))))
+  mf <- model.frame(cov_terms, df, na.action = na.pass)
+  mm_full <- model.matrix(cov_terms, mf)
+  cov_term <- attr(cov_terms, "term.labels")[attr(mm_full, "assign")[-1]]
+  mm <- mm_full[, -1, drop = FALSE]
+  colnames(mm) <- paste0("cov_", seq_len(ncol(mm)))
+  is_factor <- cov_term %in% names(attr(mm_full, "contrasts"))
+  attr(mm, "factor_groups") <- split(colnames(mm)[is_factor], cov_term[is_factor])
+  mm
+}
 
-for (outcome_type in c("MHO", "MUO")) {
-  
-  cat("\n--- 分析", outcome_type, "结局 ---\n")
-  
-  analysis_data <- data %>% filter(dataset == outcome_type)
-  cat("本轮分析总样本数:", nrow(analysis_data), "\n")
-  
-  for (exp_var in exposure_vars) {
-    
-    cat("  正在分析:", exp_var, "\n")
-
-    threshold <- quantile(analysis_data[[exp_var]], 0.90, na.rm = TRUE)
-    loop_data <- analysis_data %>% filter(.data[[exp_var]] <= threshold)
-    cat("    截取90分位数 (", round(threshold, 2), ") 以下的样本进行分析。\n")
-    cat("    原始样本数:", nrow(analysis_data), "| 截取后样本数:", nrow(loop_data), "\n")
-
-    # --- 核心建模逻辑 ---
-    
-    knots <- quantile(loop_data[[exp_var]], c(0.05, 0.35, 0.65, 0.95), na.rm = TRUE)
-    
-    rcs_basis <- rcspline.eval(loop_data[[exp_var]], knots = knots, inclx = TRUE)
-    rcs_basis_colnames <- paste0(exp_var, "_rcs", 1:ncol(rcs_basis))
-    colnames(rcs_basis) <- rcs_basis_colnames
-    loop_data <- cbind(loop_data, rcs_basis)
-
-    design <- svydesign(data = loop_data, ids = ~SDMVPSU, strata = ~SDMVSTRA, nest = TRUE, weights = ~WTSAF6YR)
-    
-    formula_str <- paste0("outcome_binary ~ ", paste(rcs_basis_colnames, collapse = " + "), " + ", paste(covariates, collapse = " + "))
-    model_formula <- as.formula(formula_str)
-    
-    model_rcs <- tryCatch(svyglm(model_formula, design = design, family = quasibinomial()), error = function(e) NULL)
-    
-    if (is.null(model_rcs) || any(is.na(coef(model_rcs)))) {
-      if(!is.null(model_rcs)) cat("    ✗ 模型拟合产生NA系数 (可能由于共线性)，无法进行预测。\n")
-      else cat("    ✗ 模型拟合失败。\n")
-      all_results[[paste(outcome_type, exp_var, sep = "_")]] <- data.frame(Outcome = outcome_type, Exposure = exp_var, Exposure_Label = flavonoid_labels[exp_var], P_Overall = NA, P_Nonlinearity = NA, stringsAsFactors = FALSE)
-      next
+# 截取后样本（建模用的完整观测）中可进入模型的协变量列，效果同 glm 的 drop.unused.levels：
+# 未出现的水平对应全0哑变量列，剔除；若某因子的参照水平（第一个水平）未出现，
+# 其余哑变量之和恒等于截距，再剔除第一个仍出现的水平列，即以该水平为新参照
+active_covariates <- function(df, cov_cols, factor_groups) {
+  cov_df <- df[complete.cases(df[c("outcome_binary", cov_cols)]), cov_cols, drop = FALSE]
+  present <- colSums(cov_df != 0) > 0
+  active <- cov_cols[present]
+  for (cols in factor_groups) {
+    if (nrow(cov_df) > 0 && all(rowSums(cov_df[cols]) == 1)) {
+      active <- setdiff(active, cols[present[cols]][1])
     }
-    cat("    ✓ RCS模型拟合成功\n")
-    
-    p_overall <- tryCatch(survey::regTermTest(model_rcs, as.formula(paste0("~", paste(rcs_basis_colnames, collapse = "+"))))$p, error = function(e) NA)
-    p_nonlinear <- tryCatch(if (length(rcs_basis_colnames) > 1) survey::regTermTest(model_rcs, as.formula(paste0("~", paste0("`", rcs_basis_colnames[-1], "`", collapse = "+"))))$p else NA, error = function(e) NA)
-    cat("    P-overall:", sprintf("%.3f", p_overall), "| P-nonlinearity:", sprintf("%.3f", p_nonlinear), "\n")
-    
-    # --- 核心预测逻辑 ---
-    cat("    生成RCS预测数据...\n")
-    
-    pred_range <- quantile(loop_data[[exp_var]], c(0.0, 0.95), na.rm = TRUE)
-    pred_seq <- seq(pred_range[1], pred_range[2], length.out = 100)
-    
-    newdata <- as.data.frame(lapply(loop_data[, covariates], function(cov) if(is.numeric(cov)) median(cov, na.rm = TRUE) else factor(names(which.max(table(cov))), levels = levels(cov))))
-    newdata <- newdata[rep(1, 100), , drop = FALSE]
-    
-    newdata_rcs_basis <- rcspline.eval(pred_seq, knots = knots, inclx = TRUE)
-    colnames(newdata_rcs_basis) <- rcs_basis_colnames
-    newdata <- cbind(newdata, newdata_rcs_basis)
-    
-    ref_value <- median(loop_data[[exp_var]], na.rm = TRUE)
-    ref_data <- newdata[1, , drop = FALSE]
-    ref_data_rcs_basis <- rcspline.eval(ref_value, knots = knots, inclx = TRUE)
-    for(i in seq_along(rcs_basis_colnames)) ref_data[[rcs_basis_colnames[i]]] <- ref_data_rcs_basis[1, i]
-
-    beta <- coef(model_rcs)
-    vcov_matrix <- vcov(model_rcs)
-    pred_formula <- delete.response(terms(model_rcs))
-    
-    X_pred <- model.matrix(pred_formula, data = newdata, xlev = model_rcs$xlevels)
-    X_ref <- model.matrix(pred_formula, data = ref_data, xlev = model_rcs$xlevels)
-    
-    if (ncol(X_pred) != length(beta)) { stop("预测矩阵和系数的维度不匹配，这是一个严重错误。") }
-    
-    fit <- as.numeric(X_pred %*% beta)
-    ref_fit <- as.numeric(X_ref %*% beta)
-    se <- sqrt(rowSums((X_pred %*% vcov_matrix) * X_pred))
-
-    rel_logit <- fit - ref_fit
-    or <- exp(rel_logit)
-    
-    z_score_70ci <- 1.036 # 70% CI
-    lower <- exp(rel_logit - z_score_70ci * se)
-    upper <- exp(rel_logit + z_score_70ci * se)
-
-    cat("    ✓ 预测数据生成成功\n")
-    
-    pred_df <- data.frame(x = pred_seq, yhat = or, lower = lower, upper = upper)
-    all_predictions[[paste(outcome_type, exp_var, sep = "_")]] <- pred_df
-    
-    # --- 绘图与保存 ---
-    cat("    绘制并保存RCS曲线...\n")
-    p <- ggplot(pred_df, aes(x = x, y = yhat)) +
-      geom_line(color = "#2E86AB", linewidth = 0.8) +
-      geom_ribbon(aes(ymin = lower, ymax = upper), alpha = 0.2, fill = "#2E86AB") +
-      geom_hline(yintercept = 1, linetype = "dashed", color = "#F24236", linewidth = 1) +
-      geom_rug(data = loop_data, aes_string(x = exp_var), inherit.aes = FALSE, sides = "b", alpha = 0.1, color = "black") +
-      coord_cartesian(ylim = c(0.3, 2.5), expand = FALSE) +
-      labs(
-        title = paste(outcome_type, flavonoid_labels[exp_var]),
-        subtitle = paste0("P-overall: ", sprintf("%.3f", p_overall), " | P-nonlinear: ", sprintf("%.3f", p_nonlinear)),
-        x = "Intake (mg)",
-        y = "Odds Ratio (70% CI)"
-      ) +
-      theme_bw() + # 使用 theme_bw() 作为基础，它有边框
-      theme(
-        text = element_text(family = "Times New Roman"),
-        plot.title = element_text(hjust = 0.5, face = "bold", size = 14),
-        plot.subtitle = element_text(hjust = 0.5, size = 11),
-        axis.title = element_text(size = 12),
-        axis.text = element_text(size = 10, color = "black"), # 确保刻度文字是黑色
-        # ======================= 修改点: 移除背景网格线，保留轴线 =======================
-        panel.grid.major = element_blank(),
-        panel.grid.minor = element_blank(),
-        panel.border = element_blank(), # 移除面板边框
-        axis.line = element_line(color = "black") # 添加轴线
-      )
-    
-    ggsave(file.path("outputs", paste0("RCS_", outcome_type, "_", exp_var, ".png")), plot = p, width = 5, height = 4.5, dpi = 300)
-    
-    all_results[[paste(outcome_type, exp_var, sep = "_")]] <- data.frame(Outcome = outcome_type, Exposure = exp_var, Exposure_Label = flavonoid_labels[exp_var], P_Overall = p_overall, P_Nonlinearity = p_nonlinear, stringsAsFactors = FALSE)
-    cat("    ✓ 图形与预测保存完成\n")
   }
+  active
+}
+
+# 相对参照点的对比矩阵：截距与协变量列在 X(x) - X(ref) 中恰好抵消，
+# 只剩样条基之差；spec: list(knots, prefix)
+build_contrast_matrix <- function(x, ref_value, spec) {
+  basis <- build_spline_basis(c(x, ref_value), spec$knots, spec$prefix)
+  n <- length(x)
+  sweep(basis[seq_len(n), , drop = FALSE], 2, basis[n + 1, ])
+}
+
+# 所有RCS图的主题设为全局默认，每张图直接继承，无需逐图叠加主题
+theme_set(
+  theme_bw() + # 使用 theme_bw() 作为基础，它有边框
+    theme(
+      text = element_text(family = "Times New Roman"),
+      plot.title = element_text(hjust = 0.5, face = "bold", size = 14),
+      plot.subtitle = element_text(hjust = 0.5, size = 11),
+      axis.title = element_text(size = 12),
+      axis.text = element_text(size = 10, color = "black"), # 确保刻度文字是黑色
+      # ======================= 修改点: 移除背景网格线，保留轴线 =======================
+      panel.grid.major = element_blank(),
+      panel.grid.minor = element_blank(),
+      panel.border = element_blank(), # 移除面板边框
+      axis.line = element_line(color = "black") # 添加轴线
+    )
+)
+
+# 所有RCS图共用的参考线、坐标范围与轴标签，只构建一次
+rcs_ref_line <- geom_hline(yintercept = 1, linetype = "dashed", color = "#F24236", linewidth = 1)
+rcs_plot_style <- list(
+  coord_cartesian(ylim = c(0.3, 2.5), expand = FALSE),
+  labs(x = "Intake (mg)", y = "Odds Ratio (70% CI)")
+)
+
+# PNG输出设备：若安装了 ragg 则使用其AGG光栅化设备（比默认png设备快且抗锯齿一致），
+# 否则用cairo版png设备；二者都不可用时才用平台默认png设备（macOS上为Quartz，fork后使用不安全）
+rcs_png_type <- if (requireNamespace("ragg", quietly = TRUE)) "ragg" else if (capabilities("cairo")) "cairo" else "default"
+save_rcs_png <- function(filename, plot, width, height) {
+  switch(rcs_png_type,
+    ragg = ggsave(filename, plot = plot, device = ragg::agg_png, width = width, height = height, dpi = 300),
+    cairo = ggsave(filename, plot = plot, device = "png", type = "cairo", width = width, height = height, dpi = 300),
+    ggsave(filename, plot = plot, device = "png", width = width, height = height, dpi = 300)
+  )
+}
+
+# 绘制单张RCS曲线：只接收预测数据与暴露原始值，图对象不引用建模过程中的大对象
+draw_rcs_plot <- function(pred_df, x_data, title, subtitle) {
+  # 地毯图抽稀到约500个点，绘制的线段大幅减少；每个保留的刻度代表 step 个原始刻度，
+  # 透明度取 step 个 alpha=0.1 刻度叠加后的不透明度，使地毯深浅仍与真实密度一致
+  rug_step <- max(1, length(x_data) %/% 500)
+  rug_x <- x_data[seq(1, length(x_data), by = rug_step)]
+  rug_alpha <- 1 - (1 - 0.1)^rug_step
+  # 预测网格 x 由 seq() 生成、本身单调递增，用 geom_path 直接连线，省去 geom_line 内部按 x 的排序
+  ggplot(pred_df, aes(x = x, y = yhat)) +
+    geom_path(color = "#2E86AB", linewidth = 0.8) +
+    geom_ribbon(aes(ymin = lower, ymax = upper), alpha = 0.2, fill = "#2E86AB") +
+    rcs_ref_line +
+    geom_rug(data = data.frame(x = rug_x), aes(x = x), inherit.aes = FALSE, sides = "b", alpha = rug_alpha, color = "black") +
+    labs(title = title, subtitle = subtitle) +
+    rcs_plot_style
+}
+
+# 单个 结局×暴露 组合的完整分析（建模、预测、绘图）
+# 各组合之间不共享可变状态，返回 list(result, prediction, plot)
+run_one <- function(outcome_type, exp_var, analysis_data, cov_cols, cov_groups) {
+  
+  cat("  正在分析:", outcome_type, "-", exp_var, "\n")
+
+  threshold <- quantile(analysis_data[[exp_var]], 0.90, na.rm = TRUE)
+  loop_data <- analysis_data %>% filter(.data[[exp_var]] <= threshold)
+  cat("    截取90分位数 (", round(threshold, 2), ") 以下的样本进行分析。\n")
+  cat("    原始样本数:", nrow(analysis_data), "| 截取后样本数:", nrow(loop_data), "\n")
+
+  # --- 核心建模逻辑 ---
+  
+  x_q <- exposure_quantiles(loop_data[[exp_var]])
+  knots <- x_q$knots
+  
+  rcs_basis <- build_spline_basis(loop_data[[exp_var]], knots, exp_var)
+  rcs_basis_colnames <- colnames(rcs_basis)
+  loop_data <- cbind(loop_data, rcs_basis)
+
+  cov_active <- active_covariates(loop_data, cov_cols, cov_groups)
+
+  design <- svydesign(data = loop_data, ids = ~SDMVPSU, strata = ~SDMVSTRA, nest = TRUE, weights = ~WTSAF6YR)
+  
+  formula_str <- paste0("outcome_binary ~ ", paste(rcs_basis_colnames, collapse = " + "), " + ", paste(cov_active, collapse = " + "))
+  model_formula <- as.formula(formula_str)
+  design_spec <- list(knots = knots, prefix = exp_var)
+  
+  model_rcs <- tryCatch(svyglm(model_formula, design = design, family = quasibinomial()), error = function(e) NULL)
+  
+  if (is.null(model_rcs) || anyNA(coef(model_rcs))) {
+    if(!is.null(model_rcs)) cat("    ✗ 模型拟合产生NA系数 (可能由于共线性)，无法进行预测。\n")
+    else cat("    ✗ 模型拟合失败。\n")
+    return(list(result = data.frame(Outcome = outcome_type, Exposure = exp_var, Exposure_Label = flavonoid_labels[exp_var], P_Overall = NA, P_Nonlinearity = NA, stringsAsFactors = FALSE), prediction = NULL))
+  }
+  cat("    ✓ RCS模型拟合成功\n")
+  
+  # Wald检验直接按项名指定，无需每次拼接并解析检验公式
+  p_overall <- tryCatch(survey::regTermTest(model_rcs, rcs_basis_colnames)$p, error = function(e) NA)
+  p_nonlinear <- tryCatch(if (length(rcs_basis_colnames) > 1) survey::regTermTest(model_rcs, rcs_basis_colnames[-1])$p else NA, error = function(e) NA)
+  cat("    P-overall:", sprintf("%.3f", p_overall), "| P-nonlinearity:", sprintf("%.3f", p_nonlinear), "\n")
+  
+  # --- 核心预测逻辑 ---
+  cat("    生成RCS预测数据...\n")
+  
+  pred_seq <- seq(x_q$pred_range[1], x_q$pred_range[2], length.out = 100)
+  
+  # 只需样条系数及其协方差子块
+  beta <- coef(model_rcs)[rcs_basis_colnames]
+  vcov_matrix <- vcov(model_rcs)[rcs_basis_colnames, rcs_basis_colnames]
+  
+  X_contrast <- build_contrast_matrix(pred_seq, x_q$ref_value, design_spec)
+  
+  rel_logit <- as.numeric(X_contrast %*% beta)
+  # 只计算 X V X' 的对角线（逐点方差），不构造 n×n 矩阵
+  se <- sqrt(pmax(rowSums((X_contrast %*% vcov_matrix) * X_contrast), 0))
+  or <- exp(rel_logit)
+  
+  z_score_70ci <- 1.036 # 70% CI
+  lower <- exp(rel_logit - z_score_70ci * se)
+  upper <- exp(rel_logit + z_score_70ci * se)
+
+  cat("    ✓ 预测数据生成成功\n")
+  
+  # 每行带上 结局/暴露 键，合并后的预测文件可直接按组合分组，而不依赖行位置
+  pred_df <- data.frame(outcome = outcome_type, exposure = exp_var, x = pred_seq, yhat = or, lower = lower, upper = upper, stringsAsFactors = FALSE)
+  
+  # --- 绘图与保存 ---
+  cat("    绘制并保存RCS曲线...\n")
+  p <- draw_rcs_plot(
+    pred_df, loop_data[[exp_var]],
+    title = paste(outcome_type, flavonoid_labels[exp_var]),
+    subtitle = paste0("P-overall: ", sprintf("%.3f", p_overall), " | P-nonlinear: ", sprintf("%.3f", p_nonlinear))
+  )
+  
+  save_rcs_png(file.path("outputs", paste0("RCS_", outcome_type, "_", exp_var, ".png")), p, width = 5, height = 4.5)
+  
+  cat("    ✓ 图形与预测保存完成\n")
+  
+  list(
+    result = data.frame(Outcome = outcome_type, Exposure = exp_var, Exposure_Label = flavonoid_labels[exp_var], P_Overall = p_overall, P_Nonlinearity = p_nonlinear, stringsAsFactors = FALSE),
+    prediction = pred_df,
+    # 图对象随结果序列化回主进程供组合图使用：draw_rcs_plot() 的环境只含预测数据与暴露值向量，
+    # 因此传回开销很小；不要在 run_one() 内直接构建图，否则闭包会带上 design/模型等大对象
+    plot = p
+  )
+}
+
+# 按结局一次性拆分数据，每个结局只做一次协变量编码
+data_by_outcome <- split(data, data$dataset)
+analysis_sets <- lapply(setNames(nm = c("MHO", "MUO")), function(outcome_type) {
+  analysis_data <- droplevels(data_by_outcome[[outcome_type]])
+  rownames(analysis_data) <- NULL
+  cat(outcome_type, "分析总样本数:", nrow(analysis_data), "\n")
+  cov_matrix <- encode_covariates(analysis_data, covariates)
+  list(data = cbind(analysis_data, cov_matrix), cov_cols = colnames(cov_matrix), cov_groups = attr(cov_matrix, "factor_groups"))
+})
+rm(data_by_outcome)
+
+# RCS分析主循环：2个结局 × 7个暴露 共14个相互独立的模型并行拟合
+# (Windows不支持fork，退化为串行；worker中要保存PNG，没有可在fork后安全使用的PNG设备时同样串行)
+cat("\n开始RCS分析...\n")
+tasks <- expand.grid(exp_var = exposure_vars, outcome_type = names(analysis_sets), stringsAsFactors = FALSE)
+task_keys <- paste(tasks$outcome_type, tasks$exp_var, sep = "_")
+n_cores <- if (.Platform$OS.type == "windows" || rcs_png_type == "default") 1L else max(1L, min(nrow(tasks), parallel::detectCores(), na.rm = TRUE))
+
+# 用 mclapply 按任务序号分发并在worker内取出参数：mcmapply 内部以 c() 合并结果，
+# 会抹掉失败任务的错误类并丢弃被杀死worker的 NULL 结果，使结果与 task_keys 错位
+task_outcomes <- tasks$outcome_type
+task_exposures <- tasks$exp_var
+task_output <- parallel::mclapply(seq_along(task_keys), function(i) {
+  outcome_type <- task_outcomes[i]
+  exp_var <- task_exposures[i]
+  set <- analysis_sets[[outcome_type]]
+  tryCatch({
+    if (n_cores == 1L) {
+      run_one(outcome_type, exp_var, set$data, set$cov_cols, set$cov_groups)
+    } else {
+      # 并行时各任务的标准输出先收集，由主进程按任务顺序打印，避免多个worker的cat()输出交错
+      # (capture.output 只截获stdout，警告与message仍会直接输出)；串行时照常实时打印进度
+      log <- capture.output(res <- run_one(outcome_type, exp_var, set$data, set$cov_cols, set$cov_groups))
+      c(res, list(log = log))
+    }
+  }, error = function(e) e)
+}, mc.cores = n_cores)
+
+# 失败任务：worker内捕获的错误、mclapply返回的try-error，或worker异常退出时的NULL
+task_error_message <- function(res) {
+  if (is.null(res)) return("worker进程异常退出，未返回结果")
+  if (inherits(res, "try-error")) res <- attr(res, "condition")
+  conditionMessage(res)
+}
+failed <- vapply(task_output, function(res) is.null(res) || inherits(res, c("error", "try-error")), logical(1))
+for (i in seq_along(task_output)) {
+  if (failed[i]) cat("  ✗", task_keys[i], "分析出错:", task_error_message(task_output[[i]]), "\n") else if (!is.null(task_output[[i]]$log)) cat(task_output[[i]]$log, sep = "\n")
+}
+if (any(failed)) {
+  stop("以下组合分析出错: ", paste(task_keys[failed], collapse = ", "), "\n", task_error_message(task_output[[which(failed)[1]]]))
+}
+
+all_results <- setNames(lapply(task_output, `[[`, "result"), task_keys)
+all_predictions <- Filter(Negate(is.null), setNames(lapply(task_output, `[[`, "prediction"), task_keys))
+
+# 每个结局的组合图：列数取 ceiling(sqrt(n))，行数随之确定，保证每个暴露变量都有自己的格子
+cat("\n绘制组合图...\n")
+for (outcome_type in names(analysis_sets)) {
+  plots <- Filter(Negate(is.null), lapply(task_output[tasks$outcome_type == outcome_type], `[[`, "plot"))
+  if (length(plots) == 0) next
+  ncols <- ceiling(sqrt(length(plots)))
+  nrows <- ceiling(length(plots) / ncols)
+  combined_plot <- wrap_plots(plots, ncol = ncols, nrow = nrows)
+  combined_path <- file.path("outputs", paste0("RCS_", outcome_type, "_Combined.png"))
+  save_rcs_png(combined_path, combined_plot, width = 5 * ncols, height = 4.5 * nrows)
+  cat("✓ 组合图已保存:", combined_path, "\n")
 }
 
 # 整理并保存结果
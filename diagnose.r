@@ -16,10 +16,15 @@ options(survey.lonely.psu = "adjust")
 # --- 1. 数据加载 ---
 cat("--- 1. 正在加载数据 ---\n")
 data_path <- file.path("outputs", "clean_data.csv")
-if (!file.exists(data_path)) {
+rds_path <- file.path("outputs", "clean_data.rds")
+if (!file.exists(data_path) && !file.exists(rds_path)) {
   stop("错误: 未找到 outputs/clean_data.csv 文件。")
 }
-data <- read.csv(data_path, stringsAsFactors = TRUE) # 直接读为因子
+if (file.exists(rds_path) && (!file.exists(data_path) || file.mtime(rds_path) >= file.mtime(data_path))) {
+  data <- readRDS(rds_path)
+} else {
+  data <- read.csv(data_path, stringsAsFactors = TRUE) # 直接读为因子
+}
 cat("✓ 数据加载成功。\n\n")
 
 # --- 2. 准备分析数据 ---
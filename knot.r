@@ -50,10 +50,15 @@ cat("  - 自定义节点 (Knots):", paste(knots_to_use, collapse = ", "), "\n")
 # --- 2. 数据准备 ---
 cat("\n正在准备数据...\n")
 data_path <- file.path("outputs", "clean_data.csv")
-if (!file.exists(data_path)) {
+rds_path <- file.path("outputs", "clean_data.rds")
+if (!file.exists(data_path) && !file.exists(rds_path)) {
   stop("错误: 未找到 outputs/clean_data.csv 文件。")
 }
-data <- read.csv(data_path, stringsAsFactors = TRUE)
+if (file.exists(rds_path) && (!file.exists(data_path) || file.mtime(rds_path) >= file.mtime(data_path))) {
+  data <- readRDS(rds_path)
+} else {
+  data <- read.csv(data_path, stringsAsFactors = TRUE)
+}
 
 analysis_data <- data %>% filter(dataset == outcome_type)
 
@@ -79,7 +84,7 @@ formula_str <- paste0("outcome_binary ~ ", paste(rcs_basis_colnames, collapse =
 model_formula <- as.formula(formula_str)
 model_rcs <- svyglm(model_formula, design = design, family = quasibinomial())
 
-if (is.null(model_rcs) || any(is.na(coef(model_rcs)))) {
+if (is.null(model_rcs) || anyNA(coef(model_rcs))) {
   stop("模型拟合失败或产生NA系数，请检查您的节点选择或数据。")
 }
 cat("✓ 模型拟合成功。\n")
@@ -92,25 +97,16 @@ cat("  - P-overall:", sprintf("%.3f", p_overall), "| P-nonlinearity:", sprintf("
 
 pred_range <- quantile(loop_data[[exp_var]], c(0.0, 0.95), na.rm = TRUE)
 pred_seq <- seq(pred_range[1], pred_range[2], length.out = 100)
-newdata <- as.data.frame(lapply(loop_data[, covariates], function(cov) if(is.numeric(cov)) median(cov, na.rm = TRUE) else factor(names(which.max(table(cov))), levels = levels(cov))))
-newdata <- newdata[rep(1, 100), , drop = FALSE]
-newdata_rcs_basis <- rcspline.eval(pred_seq, knots = knots, inclx = TRUE)
-colnames(newdata_rcs_basis) <- rcs_basis_colnames
-newdata <- cbind(newdata, newdata_rcs_basis)
 ref_value <- median(loop_data[[exp_var]], na.rm = TRUE)
-ref_data <- newdata[1, , drop = FALSE]
-ref_data_rcs_basis <- rcspline.eval(ref_value, knots = knots, inclx = TRUE)
-for(i in seq_along(rcs_basis_colnames)) ref_data[[rcs_basis_colnames[i]]] <- ref_data_rcs_basis[1, i]
-beta <- coef(model_rcs)
-vcov_matrix <- vcov(model_rcs)
-pred_formula <- delete.response(terms(model_rcs))
-X_pred <- model.matrix(pred_formula, data = newdata, xlev = model_rcs$xlevels)
-X_ref <- model.matrix(pred_formula, data = ref_data, xlev = model_rcs$xlevels)
-if (ncol(X_pred) != length(beta)) { stop("预测矩阵和系数的维度不匹配。") }
-fit <- as.numeric(X_pred %*% beta)
-ref_fit <- as.numeric(X_ref %*% beta)
-se <- sqrt(rowSums((X_pred %*% vcov_matrix) * X_pred))
-rel_logit <- fit - ref_fit
+pred_rcs_basis <- rcspline.eval(c(pred_seq, ref_value), knots = knots, inclx = TRUE)
+colnames(pred_rcs_basis) <- rcs_basis_colnames
+# 与 02_rcs_analysis.r 相同：相对参照点的对比 X(x) - X(ref) 中截距与协变量列恰好抵消，
+# 只用样条基之差及其系数/协方差子块，置信带在参照点处宽度为0，两处图形可直接比较
+X_contrast <- sweep(pred_rcs_basis[seq_along(pred_seq), , drop = FALSE], 2, pred_rcs_basis[length(pred_seq) + 1, ])
+beta <- coef(model_rcs)[rcs_basis_colnames]
+vcov_matrix <- vcov(model_rcs)[rcs_basis_colnames, rcs_basis_colnames]
+rel_logit <- as.numeric(X_contrast %*% beta)
+se <- sqrt(pmax(rowSums((X_contrast %*% vcov_matrix) * X_contrast), 0))
 or <- exp(rel_logit)
 z_score_70ci <- 1.036
 lower <- exp(rel_logit - z_score_70ci * se)